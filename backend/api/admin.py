@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.models import User
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import UserProfile, AnalyticsLog
+from .models import UserProfile, AnalyticsLog, DashboardSnapshot, LastKnownGood, PrecomputeFailure
 
 # Inline admin for UserProfile
 class UserProfileInline(admin.StackedInline):
@@ -41,4 +45,52 @@ class AnalyticsLogAdmin(admin.ModelAdmin):
     list_display = ('user', 'action', 'timestamp', 'ip_address')
     list_filter = ('action', 'timestamp')
     search_fields = ('user__username', 'action', 'details')
-    readonly_fields = ('timestamp',)
+    exclude = ('profile_data',)
+    readonly_fields = ('timestamp', 'profile_download')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('profile_data')
+
+    def get_urls(self):
+        urls = [
+            path('<int:log_id>/profile/', self.admin_site.admin_view(self.download_profile),
+                 name='api_analyticslog_profile'),
+        ]
+        return urls + super().get_urls()
+
+    def download_profile(self, request, log_id):
+        log = get_object_or_404(AnalyticsLog, id=log_id)
+        if not log.profile_data:
+            raise Http404('No profile stored for this entry')
+        response = HttpResponse(log.profile_data, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="request-{log.id}.folded"'
+        return response
+
+    def profile_download(self, obj):
+        if obj.action != 'REQUEST_PROFILE':
+            return '-'
+        url = reverse('admin:api_analyticslog_profile', args=[obj.id])
+        return format_html('<a href="{}">Download folded stacks (flamegraph)</a>', url)
+    profile_download.short_description = 'Profile'
+
+
+@admin.register(DashboardSnapshot)
+class DashboardSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('lichess_username', 'kind', 'refreshed_at')
+    list_filter = ('kind',)
+    search_fields = ('lichess_username',)
+    readonly_fields = ('refreshed_at',)
+
+
+@admin.register(LastKnownGood)
+class LastKnownGoodAdmin(admin.ModelAdmin):
+    list_display = ('key', 'fetched_at')
+    search_fields = ('key',)
+    readonly_fields = ('fetched_at',)
+
+
+@admin.register(PrecomputeFailure)
+class PrecomputeFailureAdmin(admin.ModelAdmin):
+    list_display = ('lichess_username', 'failures', 'retry_at')
+    search_fields = ('lichess_username',)
+    readonly_fields = ('last_error',)
@@ -0,0 +1,188 @@
+from contextlib import nullcontext
+
+import numpy as np
+from scipy.special import expit
+
+from . import metrics
+from .rating_predictor import RatingPredictor, prepare_series
+
+# Same k bounds as RatingPredictor.train
+K_MIN, K_MAX = 0.0001, 1.0
+
+# Extra (k, t0 as a fraction of the time span) starting points for fits that end on
+# the L=ceiling or t0=first-point bound, a flat local minimum both solvers can fall into
+RESTARTS = ((0.3, 0.1), (0.3, 0.3), (0.3, 0.6), (0.05, 0.3))
+
+
+def _pack(series, ceiling):
+    """Pad (t, y) series into (B, N) arrays plus per-series bounds and initial guesses"""
+    n_series = len(series)
+    width = max(len(t) for t, _ in series)
+    T = np.zeros((n_series, width))
+    Y = np.zeros((n_series, width))
+    M = np.zeros((n_series, width))
+    lo = np.empty((n_series, 3))
+    hi = np.empty((n_series, 3))
+    p0 = np.empty((n_series, 3))
+    for i, (t, y) in enumerate(series):
+        n = len(t)
+        T[i, :n] = t
+        Y[i, :n] = y
+        M[i, :n] = 1.0
+        max_rating = float(np.max(y))
+        lo[i] = (max_rating, K_MIN, t.min())
+        hi[i] = (ceiling, K_MAX, t.max())
+        p0[i] = (min(max_rating + 100, ceiling), 0.1, np.median(t))
+    return T, Y, M, lo, hi, p0
+
+
+def _residuals(p, T, Y, M):
+    """Masked residuals (B, N) and transposed Jacobian (B, 3, N) of the logistic curve"""
+    L, k, t0 = p[:, 0:1], p[:, 1:2], p[:, 2:3]
+    d = T - t0
+    s = expit(k * d)
+    ds = L * s * (1 - s)
+    r = (L * s - Y) * M
+    J = np.stack([s, ds * d, -ds * k], axis=1) * M[:, None, :]
+    return r, J
+
+
+def _solve_chunk(T, Y, M, lo, hi, p0, max_iter, ftol, xtol):
+    """
+    Bounded Levenberg-Marquardt over a whole chunk at once. Parameters sitting
+    on a bound with the gradient pointing outward are frozen for that step,
+    the rest take a Marquardt-scaled step that is then projected into the box.
+    """
+    n_series = len(T)
+    p = np.clip(p0, lo, hi)
+    lam = np.full(n_series, 1e-3)
+    r, J = _residuals(p, T, Y, M)
+    cost = 0.5 * np.einsum('bn,bn->b', r, r)
+    active = np.arange(n_series)
+    eye = np.eye(3)
+
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        pa, ra, Ja = p[active], r[active], J[active]
+        g = np.matmul(Ja, ra[..., None])[..., 0]
+        H = np.matmul(Ja, Ja.transpose(0, 2, 1))
+
+        pinned = ((pa <= lo[active]) & (g > 0)) | ((pa >= hi[active]) & (g < 0))
+        diag = np.diagonal(H, axis1=1, axis2=2)
+        diag = diag + 1e-12 * (1.0 + diag.max(axis=1, keepdims=True))
+        A = H + lam[active, None, None] * diag[:, :, None] * eye
+        free = ~pinned
+        A = A * free[:, :, None] * free[:, None, :] + pinned[:, :, None] * eye
+        step = np.linalg.solve(A, -(g * free)[..., None])[..., 0]
+
+        p_new = np.clip(pa + step, lo[active], hi[active])
+        r_new, J_new = _residuals(p_new, T[active], Y[active], M[active])
+        cost_new = 0.5 * np.einsum('bn,bn->b', r_new, r_new)
+
+        improved = cost_new < cost[active]
+        accepted = active[improved]
+        small_gain = cost[accepted] - cost_new[improved] <= ftol * cost[accepted]
+        moved = np.abs(p_new[improved] - pa[improved])
+        small_step = np.all(moved <= xtol * (xtol + np.abs(pa[improved])), axis=1)
+
+        p[accepted] = p_new[improved]
+        r[accepted] = r_new[improved]
+        J[accepted] = J_new[improved]
+        cost[accepted] = cost_new[improved]
+        lam[active] = np.where(improved, lam[active] * 0.3, lam[active] * 10.0)
+
+        done = np.zeros(len(active), dtype=bool)
+        done[improved] = small_gain | small_step
+        # Rejected steps with a huge damping factor mean no descent direction is left
+        done |= lam[active] > 1e12
+        active = active[~done]
+    return p, cost
+
+
+def _on_suspect_bound(p, lo, hi):
+    """Rows whose fit ended with L at the ceiling or t0 at the first data point"""
+    return (p[:, 0] >= hi[:, 0]) | (p[:, 2] <= lo[:, 2])
+
+
+def _fit_chunk(T, Y, M, lo, hi, p0, max_iter, ftol, xtol):
+    """Solve a chunk, then retry rows on a suspect bound from RESTARTS and keep the lowest cost"""
+    p, cost = _solve_chunk(T, Y, M, lo, hi, p0, max_iter, ftol, xtol)
+    retry = np.flatnonzero(_on_suspect_bound(p, lo, hi))
+    if not len(retry):
+        return p
+    lo_r, hi_r = lo[retry], hi[retry]
+    for k, fraction in RESTARTS:
+        start = p0[retry].copy()
+        start[:, 1] = k
+        start[:, 2] = lo_r[:, 2] + fraction * (hi_r[:, 2] - lo_r[:, 2])
+        p_alt, cost_alt = _solve_chunk(T[retry], Y[retry], M[retry], lo_r, hi_r, start, max_iter, ftol, xtol)
+        better = cost_alt < cost[retry]
+        p[retry[better]] = p_alt[better]
+        cost[retry[better]] = cost_alt[better]
+    return p
+
+
+def fit_logistic_batch(series, max_rating_ceiling=2700, max_iter=200, chunk_size=1024, ftol=1e-10, xtol=1e-10,
+                       record_metrics=True):
+    """
+    Fit the RatingPredictor logistic curve to many (t, y) series at once.
+    Series are sorted by length and solved in chunks to keep padding small.
+    Returns an (n, 3) array of (L, k, t0); rows are NaN where RatingPredictor.train
+    would fail (fewer than 5 points, no time span, or ratings at the ceiling).
+    Pass record_metrics=False in pool workers, whose metrics are never exported.
+    """
+    params = np.full((len(series), 3), np.nan)
+    valid = [
+        i for i, (t, y) in enumerate(series)
+        if len(t) >= 5 and t.max() > t.min() and np.max(y) < max_rating_ceiling
+    ]
+    valid.sort(key=lambda i: len(series[i][0]))
+    with metrics.timed('batch_fit') if record_metrics else nullcontext():
+        for start in range(0, len(valid), chunk_size):
+            idx = valid[start:start + chunk_size]
+            T, Y, M, lo, hi, p0 = _pack([series[i] for i in idx], max_rating_ceiling)
+            params[idx] = _fit_chunk(T, Y, M, lo, hi, p0, max_iter, ftol, xtol)
+    return params
+
+
+def train_many(rating_point_lists):
+    """Batch counterpart of RatingPredictor.train: a trained predictor, or None, per input"""
+    predictors = [RatingPredictor() for _ in rating_point_lists]
+    series = [prepare_series(points) if len(points) >= 5 else (np.zeros(0), np.zeros(0))
+              for points in rating_point_lists]
+    ceiling = predictors[0].max_rating_ceiling if predictors else 2700
+    params = fit_logistic_batch(series, max_rating_ceiling=ceiling)
+    result = []
+    for predictor, (t, y), row in zip(predictors, series, params):
+        if np.isnan(row).any():
+            result.append(None)
+            continue
+        predictor.params = row
+        predictor.t_min, predictor.t_max = t.min(), t.max()
+        predictor.t_train, predictor.y_train = t, y
+        predictor.is_trained = True
+        result.append(predictor)
+    return result
+
+
+def predict_variants_many(histories, variants=('bullet', 'blitz', 'rapid'), n_months=60):
+    """
+    predict_variants for many rating histories with one batched fit.
+    Variants that cannot be fitted get an empty list instead of raising.
+    """
+    points = []
+    for history in histories:
+        for variant in variants:
+            variant_data = next((v for v in history if v['name'].lower() == variant), None)
+            points.append((variant_data.get('points') or []) if variant_data else [])
+
+    predictors = iter(train_many(points))
+    results = []
+    for _ in histories:
+        predictions = {}
+        for variant in variants:
+            predictor = next(predictors)
+            predictions[variant] = predictor.predict_next_n(n_months=n_months) if predictor else []
+        results.append(predictions)
+    return results
@@ -1,6 +1,11 @@
 import os
+import time
+import weakref
 import requests
 
+from . import metrics, upstream_scheduler
+from .circuit_breaker import CircuitOpenError, get_breaker
+
 LICHESS_API = 'https://lichess.org/api'
 
 def get_headers(token=None):
@@ -10,39 +15,130 @@ def get_headers(token=None):
         headers['Authorization'] = f'Bearer {token}'
     return headers
 
+def is_outage_status(status_code):
+    """Statuses that count against the circuit breaker"""
+    return status_code >= 500 or status_code == 429
+
+def _close_upstream(resp, slot):
+    try:
+        resp.close()
+    finally:
+        slot.release()
+
+
+class UpstreamStream:
+    """
+    A streamed Lichess response that holds its scheduler slot until closed.
+    Iterating yields the body in chunks as they arrive and closes the stream
+    at the end; close() may also be called without iterating (e.g. by
+    StreamingHttpResponse when the client goes away) or more than once. A
+    stream that is dropped unclosed is closed when it is garbage collected.
+    """
+
+    def __init__(self, resp, slot):
+        self.response = resp
+        self._finalizer = weakref.finalize(self, _close_upstream, resp, slot)
+
+    def __iter__(self):
+        for chunk in self.response.iter_content(chunk_size=None):
+            if chunk:
+                yield chunk
+        self.close()
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get(endpoint, url, **kwargs):
+    """
+    Issue a GET against Lichess once the upstream scheduler grants a slot,
+    through the circuit breaker for `endpoint`, recording latency and status.
+    Raises CircuitOpenError while the circuit is open, before queueing for a
+    slot, so calls that cannot go upstream neither wait nor spend rate budget.
+    With stream=True an UpstreamStream holding the slot is returned instead
+    of the response, and only the time to response headers is recorded.
+    """
+    breaker = get_breaker(endpoint)
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        metrics.upstream_requests.inc(endpoint, 'circuit_open')
+        raise
+    try:
+        slot = upstream_scheduler.acquire()
+    except BaseException:
+        breaker.cancel_call()
+        raise
+    start = time.perf_counter()
+    try:
+        resp = requests.get(url, **kwargs)
+    except requests.RequestException as e:
+        slot.release()
+        breaker.record_failure()
+        metrics.upstream_requests.inc(endpoint, type(e).__name__)
+        raise
+    finally:
+        metrics.upstream_request_duration.observe(time.perf_counter() - start, endpoint)
+    if is_outage_status(resp.status_code):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    metrics.upstream_requests.inc(endpoint, str(resp.status_code))
+
+    if kwargs.get('stream'):
+        return UpstreamStream(resp, slot)
+    slot.release()
+    return resp
+
 def fetch_account(token=None):
     headers = get_headers(token)
-    resp = requests.get(f'{LICHESS_API}/account', headers=headers, timeout=15)
+    resp = get('account', f'{LICHESS_API}/account', headers=headers, timeout=15)
     resp.raise_for_status()
     return resp.json()
 
-def fetch_user_games(username, token=None, max_games=10):
+def open_stream(endpoint, url, **kwargs):
+    """
+    Start a streamed GET and return (content_type, UpstreamStream).
+    Upstream errors are raised here, before any of the body is read.
+    """
+    stream = get(endpoint, url, stream=True, **kwargs)
+    try:
+        stream.response.raise_for_status()
+    except requests.HTTPError:
+        stream.close()
+        raise
+    return stream.response.headers.get('content-type', 'application/octet-stream'), stream
+
+def stream_user_games(username, token=None, max_games=10, pgn=False):
+    """Stream a user's games as NDJSON (with PGN in each object) or as plain PGN"""
     headers = get_headers(token)
-    params = {'max': max_games, 'pgnInJson': True}
-    resp = requests.get(f'{LICHESS_API}/games/user/{username}', headers=headers, params=params, timeout=30)
-    # The endpoint can stream; here we return text for simplicity
-    if resp.headers.get('content-type','').startswith('application/x-ndjson') or resp.text.startswith('[') or resp.text.startswith('{'):
-        try:
-            return resp.json()
-        except Exception:
-            return resp.text
-    return resp.text
-
-def export_game(game_id, token=None):
+    if pgn:
+        headers['Accept'] = 'application/x-chess-pgn'
+        params = {'max': max_games}
+    else:
+        headers['Accept'] = 'application/x-ndjson'
+        params = {'max': max_games, 'pgnInJson': True}
+    return open_stream('user_games', f'{LICHESS_API}/games/user/{username}', headers=headers, params=params, timeout=30)
+
+def stream_game_export(game_id, token=None):
     headers = get_headers(token)
-    resp = requests.get(f'{LICHESS_API}/game/export/{game_id}', headers=headers, timeout=20)
-    resp.raise_for_status()
-    return resp.text
+    headers['Accept'] = 'application/x-chess-pgn'
+    return open_stream('game_export', f'{LICHESS_API}/game/export/{game_id}', headers=headers, timeout=20)
 
 def fetch_rating_history(username):
     url = f'{LICHESS_API}/user/{username}/rating-history'
-    resp = requests.get(url, timeout=15)
+    resp = get('rating_history', url, timeout=15)
     resp.raise_for_status()
     return resp.json()
 
 def fetch_user_profile(username):
     url = f'{LICHESS_API}/user/{username}'
-    resp = requests.get(url, timeout=15)
+    resp = get('user_profile', url, timeout=15)
     resp.raise_for_status()
     return resp.json()
-
@@ -1,9 +1,11 @@
-import requests
 import json
 import io
 import chess.pgn
 from collections import defaultdict
 
+from . import metrics
+from .lichess_client import get
+
 def fetch_last_100_games(username):
     """
     Stream last 100 games PGNs for a user from Lichess public API
@@ -21,12 +23,14 @@ def fetch_last_100_games(username):
     headers = {
         "Accept": "application/x-ndjson"
     }
-    response = requests.get(url, params=params, headers=headers, stream=True)
-    response.raise_for_status()
+    # Closing the stream also frees its upstream scheduler slot
+    with get("opening_games", url, params=params, headers=headers, stream=True) as stream:
+        response = stream.response
+        response.raise_for_status()
 
-    for line in response.iter_lines():
-        if line:
-            yield json.loads(line.decode('utf-8'))
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line.decode('utf-8'))
 
 def analyze_openings(username):
     """
@@ -40,7 +44,8 @@ def analyze_openings(username):
 
     for game_json in fetch_last_100_games(username):
         pgn_text = game_json.get("pgn")
-        game = chess.pgn.read_game(io.StringIO(pgn_text))
+        with metrics.timed("pgn_parse"):
+            game = chess.pgn.read_game(io.StringIO(pgn_text))
         headers = game.headers
         eco = headers.get("ECO", "Unknown")
         opening_name = headers.get("Opening", "Unknown Opening")
@@ -80,6 +85,11 @@ def analyze_openings(username):
 
     return opening_stats
 
+def opening_repertoire(username):
+    """analyze_openings with plain dicts, ready for JSON serialization"""
+    stats = analyze_openings(username)
+    return {color: dict(openings) for color, openings in stats.items()}
+
 def print_opening_stats(opening_stats):
     for color in ["white", "black"]:
         print(f"\nOpening statistics for {color} games:")
@@ -0,0 +1,66 @@
+import time
+import warnings
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from scipy.optimize import curve_fit
+
+from api.batch_predictor import fit_logistic_batch
+from api.rating_predictor import logistic
+
+
+def synthetic_series(rng, count, ceiling=2700):
+    """Noisy logistic rating curves with 20-400 points over up to 8 years"""
+    series = []
+    for _ in range(count):
+        n = int(rng.integers(20, 400))
+        t = np.sort(rng.uniform(0, 100, n))
+        t -= t[0]
+        L, k, t0 = rng.uniform(1400, 2500), rng.uniform(0.02, 0.5), rng.uniform(0, 60)
+        y = np.round(logistic(t, L, k, t0) + rng.normal(0, 40, n))
+        series.append((t, np.minimum(y, ceiling - 1)))
+    return series
+
+
+def fit_one_by_one(series, ceiling=2700):
+    for t, y in series:
+        max_rating = y.max()
+        p0 = [min(max_rating + 100, ceiling), 0.1, np.median(t)]
+        bounds = ([max_rating, 0.0001, t.min()], [ceiling, 1.0, t.max()])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            try:
+                curve_fit(logistic, t, y, p0=p0, bounds=bounds, maxfev=10000)
+            except RuntimeError:
+                pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batched logistic fitting against one curve_fit call per series'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,100,1000,10000',
+                            help='Comma-separated batch sizes')
+        parser.add_argument('--baseline-max', type=int, default=1000,
+                            help='Largest batch size to also time with curve_fit')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f'{"series":>8} {"batch s":>9} {"batch/s":>10} {"curve_fit/s":>12} {"speedup":>8}')
+        for size in sizes:
+            series = synthetic_series(rng, size)
+            start = time.perf_counter()
+            fit_logistic_batch(series)
+            batch_time = time.perf_counter() - start
+
+            baseline = ''
+            speedup = ''
+            if size <= options['baseline_max']:
+                start = time.perf_counter()
+                fit_one_by_one(series)
+                scalar_time = time.perf_counter() - start
+                baseline = f'{size / scalar_time:.0f}'
+                speedup = f'{scalar_time / batch_time:.1f}x'
+            self.stdout.write(f'{size:>8} {batch_time:>9.3f} {size / batch_time:>10.0f} {baseline:>12} {speedup:>8}')
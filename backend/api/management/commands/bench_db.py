@@ -0,0 +1,102 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.models import AnalyticsLog, UserProfile
+
+
+def read_op(user_ids):
+    """What the admin analytics page and a profile lookup read"""
+    list(AnalyticsLog.objects.defer('profile_data')[:50])
+    UserProfile.objects.filter(is_premium=True).count()
+    User.objects.select_related('profile').get(id=random.choice(user_ids))
+
+
+def write_op(user_ids):
+    """What log_analysis writes for every prediction"""
+    with transaction.atomic():
+        user = User.objects.select_related('profile').get(id=random.choice(user_ids))
+        AnalyticsLog.objects.create(user=user, action='BENCH', details='bench')
+        profile = user.profile
+        profile.total_analyses += 1
+        profile.save()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark mixed read/write throughput of the configured DB_PROFILE on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--write-ratio', type=float, default=0.2,
+                            help='Fraction of simulated requests that write')
+        parser.add_argument('--users', type=int, default=200)
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # An in-memory test database would hide locking and fsync costs
+            test_settings['NAME'] = str(settings.BASE_DIR / 'bench.sqlite3')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, options):
+        User.objects.bulk_create(
+            User(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(options['users'])
+        )
+        UserProfile.objects.bulk_create(UserProfile(user=user) for user in User.objects.all())
+        user_ids = list(User.objects.values_list('id', flat=True))
+        connection.close()
+
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        latencies = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+
+        def worker():
+            local = {'reads': 0, 'writes': 0, 'errors': 0}
+            local_latencies = []
+            while time.monotonic() < deadline:
+                # Mirror the request cycle: non-persistent connections are closed per request
+                close_old_connections()
+                is_write = random.random() < options['write_ratio']
+                start = time.perf_counter()
+                try:
+                    (write_op if is_write else read_op)(user_ids)
+                    local['writes' if is_write else 'reads'] += 1
+                except OperationalError:
+                    local['errors'] += 1
+                local_latencies.append(time.perf_counter() - start)
+            connection.close()
+            with lock:
+                for key, value in local.items():
+                    counts[key] += value
+                latencies.extend(local_latencies)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+        total = counts['reads'] + counts['writes']
+        self.stdout.write(
+            f'profile={settings.DB_PROFILE} threads={options["threads"]} write_ratio={options["write_ratio"]}\n'
+            f'ops/s={total / elapsed:.0f} reads/s={counts["reads"] / elapsed:.0f} '
+            f'writes/s={counts["writes"] / elapsed:.0f} errors={counts["errors"]} p95={p95:.1f}ms'
+        )
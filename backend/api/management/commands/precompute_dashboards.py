@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.precompute import run_pass
+from api.stale_cache import prune_expired
+
+
+class Command(BaseCommand):
+    help = 'Precompute dashboard snapshots for users with a linked Lichess account'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single pass and exit')
+        parser.add_argument('--interval', type=int, default=settings.PRECOMPUTE_INTERVAL,
+                            help='Seconds between refreshes of the same account')
+        parser.add_argument('--rpm', type=float, default=settings.PRECOMPUTE_REQUESTS_PER_MINUTE,
+                            help='Upstream Lichess requests per minute to spend')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            refreshed = run_pass(options['interval'], options['rpm'])
+            self.stdout.write(f'Refreshed {refreshed} account(s), pruned {prune_expired()} stale value(s)')
+            if options['once']:
+                return
+            # Idle passes are cheap: one query to find due profiles
+            time.sleep(60)
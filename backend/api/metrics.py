@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, shared by every histogram
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, label_values, value
+
+
+class Histogram:
+    """Cumulative histogram keyed by a tuple of label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        for label_values, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', label_values + (_format_value(bound),), cumulative
+            yield f'{self.name}_bucket', label_values + ('+Inf',), count
+            yield f'{self.name}_sum', label_values, total
+            yield f'{self.name}_count', label_values, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format (0.0.4).
+        Each sample carries a `worker` label with this process's pid, so series
+        from different server processes never collide; aggregate across them
+        with e.g. `sum without (worker) (rate(...))`.
+        """
+        worker = (str(os.getpid()),)
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, label_values, value in metric.samples():
+                label_names = ('worker',) + metric.labels
+                if name.endswith('_bucket'):
+                    label_names = label_names + ('le',)
+                labels = _format_labels(label_names, worker + label_values)
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# Metrics live in process memory, so each worker exposes its own series (labelled worker=<pid>)
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request per view',
+    labels=('view', 'method', 'status'),
+))
+db_queries = registry.register(Histogram(
+    'http_request_db_queries', 'Database queries issued per request',
+    labels=('view',), buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+))
+db_query_duration = registry.register(Histogram(
+    'http_request_db_duration_seconds', 'Total database time per request',
+    labels=('view',),
+))
+upstream_request_duration = registry.register(Histogram(
+    'lichess_request_duration_seconds', 'Latency of Lichess API calls per endpoint',
+    labels=('endpoint',),
+))
+upstream_requests = registry.register(Counter(
+    'lichess_requests_total', 'Lichess API calls per endpoint and status',
+    labels=('endpoint', 'status'),
+))
+stage_duration = registry.register(Histogram(
+    'stage_duration_seconds', 'Time spent in instrumented processing stages',
+    labels=('stage',),
+))
+scheduler_queue_duration = registry.register(Histogram(
+    'lichess_scheduler_queue_seconds', 'Time Lichess calls waited for an upstream slot',
+    labels=('priority',),
+))
+scheduler_timeouts = registry.register(Counter(
+    'lichess_scheduler_timeouts_total', 'Lichess calls rejected after waiting too long for a slot',
+    labels=('priority',),
+))
+cache_lookups = registry.register(Counter(
+    'cache_lookups_total', 'Cache lookups per cache and result',
+    labels=('cache', 'result'),
+))
+
+
+@contextmanager
+def timed(stage):
+    """Record the wall time of the enclosed block under `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.observe(time.perf_counter() - start, stage)
+
+
+def record_cache(cache, hit):
+    cache_lookups.inc(cache, 'hit' if hit else 'miss')
@@ -0,0 +1,96 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from . import metrics, profiling
+from .models import AnalyticsLog
+
+
+class QueryTracker:
+    """Database execute wrapper counting queries and their total time"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Record per-view latency and database usage for the metrics endpoint"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tracker = QueryTracker()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(tracker))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        metrics.http_request_duration.observe(elapsed, view, request.method, str(response.status_code))
+        metrics.db_queries.observe(tracker.count, view)
+        metrics.db_query_duration.observe(tracker.duration, view)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile a single request when an admin asks for it with the
+    X-Profile header or a ?profile=1 query flag. The folded stacks are
+    stored on an AnalyticsLog entry whose id is returned in X-Profile-Id.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _profile_requested(request):
+            return self.get_response(request)
+        user = _admin_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        response, folded, elapsed = profiling.profile_call(self.get_response, request)
+        log = AnalyticsLog.objects.create(
+            user=user,
+            action='REQUEST_PROFILE',
+            details=f'{request.method} {request.get_full_path()} -> {response.status_code} in {elapsed * 1000:.0f}ms',
+            profile_data=folded,
+        )
+        response['X-Profile-Id'] = str(log.id)
+        return response
+
+
+def _profile_requested(request):
+    flags = (request.META.get('HTTP_X_PROFILE'), request.GET.get('profile'))
+    return any(flag in ('1', 'true') for flag in flags)
+
+
+def _admin_user(request):
+    """Resolve an admin user from the session or a JWT bearer token"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return user
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    if result is None or not result[0].is_staff:
+        return None
+    return result[0]
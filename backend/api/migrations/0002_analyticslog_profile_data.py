@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_create_userprofile_and_analytics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analyticslog',
+            name='profile_data',
+            field=models.TextField(blank=True),
+        ),
+    ]
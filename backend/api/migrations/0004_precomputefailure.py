@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_dashboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputeFailure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lichess_username', models.CharField(max_length=100, unique=True)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('retry_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -33,9 +33,45 @@ class AnalyticsLog(models.Model):
     details = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
+    profile_data = models.TextField(blank=True)  # folded stacks for REQUEST_PROFILE entries
     
     class Meta:
         ordering = ['-timestamp']
     
     def __str__(self):
         return f"{self.action} - {self.timestamp}"
+
+
+class DashboardSnapshot(models.Model):
+    """Precomputed dashboard data for a linked Lichess account"""
+    lichess_username = models.CharField(max_length=100)  # lowercased
+    kind = models.CharField(max_length=30)  # profile, rating_history, openings or predictions
+    data = models.JSONField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('lichess_username', 'kind')
+
+    def __str__(self):
+        return f"{self.lichess_username} {self.kind} - {self.refreshed_at}"
+
+
+class LastKnownGood(models.Model):
+    """Last successful Lichess response per lookup, served while Lichess is unavailable"""
+    key = models.CharField(max_length=200, unique=True)  # e.g. rating_history:<lowercased username>
+    data = models.JSONField()
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} - {self.fetched_at}"
+
+
+class PrecomputeFailure(models.Model):
+    """Retry backoff for a Lichess account whose snapshots could not be refreshed"""
+    lichess_username = models.CharField(max_length=100, unique=True)  # lowercased
+    failures = models.PositiveIntegerField(default=0)  # consecutive failed refreshes
+    last_error = models.TextField(blank=True)
+    retry_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.lichess_username} failed {self.failures}x, retry at {self.retry_at}"
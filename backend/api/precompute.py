@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .lichess_client import fetch_rating_history, fetch_user_profile
+from .lichess_opening_stats import opening_repertoire
+from .models import DashboardSnapshot, PrecomputeFailure, UserProfile
+from .rating_predictor import predict_variants
+from .stale_cache import is_outage
+from .batch_predictor import predict_variants_many
+from .upstream_scheduler import BACKGROUND, upstream_priority
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_BATCH_SIZE = 500
+
+# Snapshots every linked account gets; premium accounts also get 'predictions'
+SNAPSHOT_KINDS = ('profile', 'rating_history', 'openings')
+
+
+def get_snapshot(username, kind, max_age=None):
+    """Return precomputed data for a Lichess username, or None if missing or too old"""
+    max_age = max_age if max_age is not None else settings.SNAPSHOT_MAX_AGE
+    snapshot = DashboardSnapshot.objects.filter(
+        lichess_username=username.lower(),
+        kind=kind,
+        refreshed_at__gte=timezone.now() - timedelta(seconds=max_age),
+    ).only('data').first()
+    metrics.record_cache('snapshot', snapshot is not None)
+    return snapshot.data if snapshot else None
+
+
+def save_snapshot(username, kind, data):
+    DashboardSnapshot.objects.update_or_create(
+        lichess_username=username.lower(), kind=kind, defaults={'data': data},
+    )
+
+
+def refresh_snapshots(username, include_predictions=False, pause=0.0):
+    """
+    Fetch and store every dashboard snapshot for one Lichess account,
+    sleeping `pause` seconds after each upstream call. Returns the rating history.
+    """
+    save_snapshot(username, 'profile', fetch_user_profile(username))
+    time.sleep(pause)
+    history = fetch_rating_history(username)
+    save_snapshot(username, 'rating_history', history)
+    time.sleep(pause)
+    save_snapshot(username, 'openings', opening_repertoire(username))
+    if include_predictions:
+        save_snapshot(username, 'predictions', predict_variants(history))
+    time.sleep(pause)
+    return history
+
+
+def save_predictions(pending):
+    """Fit and store predictions for (username, rating history) pairs in one batch"""
+    if not pending:
+        return
+    usernames, histories = zip(*pending)
+    for username, predictions in zip(usernames, predict_variants_many(histories)):
+        save_snapshot(username, 'predictions', predictions)
+
+
+def wants_predictions(profile):
+    return profile.is_premium or profile.user.is_superuser
+
+
+def needed_kinds(include_predictions):
+    return SNAPSHOT_KINDS + (('predictions',) if include_predictions else ())
+
+
+def due_profiles(interval):
+    """
+    Linked Lichess accounts of active users, most recently active first, with a
+    snapshot they still need missing or older than `interval` seconds. Accounts
+    backing off after failed refreshes are skipped.
+    Yields (lowercased username, whether predictions are wanted).
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=interval)
+    refreshed = defaultdict(dict)
+    for username, kind, refreshed_at in DashboardSnapshot.objects.values_list(
+            'lichess_username', 'kind', 'refreshed_at'):
+        refreshed[username][kind] = refreshed_at
+    backing_off = set(
+        PrecomputeFailure.objects.filter(retry_at__gt=now).values_list('lichess_username', flat=True)
+    )
+    profiles = (
+        UserProfile.objects.select_related('user')
+        .filter(user__is_active=True, lichess_username__isnull=False)
+        .exclude(lichess_username='')
+        .order_by(F('last_login').desc(nulls_last=True), F('user__last_login').desc(nulls_last=True))
+    )
+    # Several users may link the same account; it needs predictions if any of them is premium
+    accounts = {}
+    for profile in profiles:
+        username = profile.lichess_username.lower()
+        accounts[username] = accounts.get(username, False) or wants_predictions(profile)
+    for username, include_predictions in accounts.items():
+        if username in backing_off:
+            continue
+        snapshots = refreshed.get(username, {})
+        kinds = needed_kinds(include_predictions)
+        if any(snapshots.get(kind) is None or snapshots[kind] < cutoff for kind in kinds):
+            yield username, include_predictions
+
+
+def is_due(username, include_predictions, interval):
+    """due_profiles' test for a single account"""
+    now = timezone.now()
+    if PrecomputeFailure.objects.filter(lichess_username=username, retry_at__gt=now).exists():
+        return False
+    kinds = needed_kinds(include_predictions)
+    fresh = DashboardSnapshot.objects.filter(
+        lichess_username=username, kind__in=kinds, refreshed_at__gte=now - timedelta(seconds=interval),
+    ).count()
+    return fresh < len(kinds)
+
+
+def record_failure(username, error):
+    """Back off an account exponentially after a failed refresh"""
+    failure, _ = PrecomputeFailure.objects.get_or_create(
+        lichess_username=username, defaults={'retry_at': timezone.now()},
+    )
+    failure.failures += 1
+    delay = min(settings.PRECOMPUTE_RETRY_BACKOFF * 2 ** (failure.failures - 1),
+                settings.PRECOMPUTE_MAX_RETRY_BACKOFF)
+    failure.retry_at = timezone.now() + timedelta(seconds=delay)
+    failure.last_error = f'{type(error).__name__}: {error}'
+    failure.save()
+
+
+def run_pass(interval, requests_per_minute):
+    """
+    Refresh every due profile once, spacing upstream calls to the rate budget.
+    Premium predictions are fitted together every PREDICTION_BATCH_SIZE accounts.
+    """
+    pause = 60.0 / requests_per_minute
+    refreshed = 0
+    pending = []
+    for username, include_predictions in due_profiles(interval):
+        try:
+            with upstream_priority(BACKGROUND, 'precompute'):
+                history = refresh_snapshots(username, pause=pause)
+            refreshed += 1
+        except Exception as e:
+            if is_outage(e):
+                # Not this account's fault; leave everyone else for the next pass
+                logger.warning('Lichess unavailable, stopping precompute pass: %s', e)
+                break
+            logger.exception('Failed to precompute dashboard for %s', username)
+            record_failure(username, e)
+            time.sleep(pause)
+            continue
+        PrecomputeFailure.objects.filter(lichess_username=username).delete()
+        if include_predictions:
+            pending.append((username, history))
+        else:
+            # No premium user links this account (any more); drop predictions they no longer get
+            DashboardSnapshot.objects.filter(lichess_username=username, kind='predictions').delete()
+        if len(pending) >= PREDICTION_BATCH_SIZE:
+            save_predictions(pending)
+            pending = []
+    save_predictions(pending)
+    return refreshed
+
+
+_warming = set()
+_warming_lock = threading.Lock()
+
+
+def warm_up(profile):
+    """
+    Refresh a profile's snapshots in a background thread, e.g. right after login.
+    Nothing is fetched when they are all younger than PRECOMPUTE_INTERVAL or the
+    account is backing off after failed refreshes.
+    """
+    if not profile.lichess_username:
+        return
+    username = profile.lichess_username.lower()
+    include_predictions = wants_predictions(profile)
+    if not is_due(username, include_predictions, settings.PRECOMPUTE_INTERVAL):
+        return
+    with _warming_lock:
+        if username in _warming:
+            return
+        _warming.add(username)
+
+    def run():
+        try:
+            with upstream_priority(BACKGROUND, f'warm-up:{username}'):
+                refresh_snapshots(username, include_predictions)
+            PrecomputeFailure.objects.filter(lichess_username=username).delete()
+        except Exception as e:
+            if is_outage(e):
+                logger.warning('Lichess unavailable, skipped warm-up for %s: %s', username, e)
+            else:
+                logger.exception('Failed to warm up dashboard for %s', username)
+                record_failure(username, e)
+        finally:
+            connection.close()
+            with _warming_lock:
+                _warming.discard(username)
+
+    threading.Thread(target=run, name=f'warm-up-{username}', daemon=True).start()
@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .batch_predictor import fit_logistic_batch
+from .rating_predictor import logistic, train_variants
+
+logger = logging.getLogger(__name__)
+
+# Bands are dropped when fewer resamples than this finish inside the time budget
+MIN_RESAMPLES = 20
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Process pool shared by this worker, created on first use. Workers are
+    started from a fresh interpreter (forkserver, or spawn where unavailable)
+    rather than forked from a threaded server that may hold locks.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None and settings.RATING_BOOTSTRAP_WORKERS > 0:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                # Import numpy/scipy once in the server so replacement workers start quickly
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=settings.RATING_BOOTSTRAP_WORKERS, mp_context=context)
+            # Start every worker now instead of inside the first request's time budget
+            for _ in range(settings.RATING_BOOTSTRAP_WORKERS):
+                _pool.submit(_noop)
+        return _pool
+
+
+def _noop():
+    pass
+
+
+def warm_pool():
+    """Start the pool in a background thread, e.g. when a premium user logs in"""
+    if _pool is None and settings.RATING_BOOTSTRAP_WORKERS > 0:
+        threading.Thread(target=get_pool, name='bootstrap-pool-start', daemon=True).start()
+
+
+def discard_pool(pool):
+    """Drop a broken pool so the next get_pool() call starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def bootstrap_chunk(t, fitted, residuals, t_future, size, seed, ceiling):
+    """
+    Refit `size` residual-bootstrap resamples of one series in a single batch
+    and return their future curves, one row per resample that could be fitted.
+    """
+    rng = np.random.default_rng(seed)
+    samples = fitted + residuals[rng.integers(0, len(residuals), (size, len(residuals)))]
+    # Keep resamples fittable: a series reaching the ceiling is rejected by the fit,
+    # which would drop exactly the high resamples and bias the upper band down
+    samples = np.minimum(samples, ceiling - 1)
+    params = fit_logistic_batch([(t, y) for y in samples], max_rating_ceiling=ceiling, record_metrics=False)
+    params = params[~np.isnan(params).any(axis=1)]
+    curves = logistic(t_future, params[:, 0:1], params[:, 1:2], params[:, 2:3])
+    return np.minimum(curves, ceiling)
+
+
+def _cache_key(predictor, n_months, n_resamples, level):
+    digest = hashlib.sha1()
+    for array in (predictor.t_train, predictor.y_train, predictor.params):
+        digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    digest.update(f'{n_months}:{n_resamples}:{level}:{predictor.max_rating_ceiling}'.encode())
+    return f'bands:{digest.hexdigest()}'
+
+
+def _run_on_pool(pool, jobs, curves, deadline):
+    """
+    Run bootstrap jobs on the pool until they finish or the deadline passes.
+    A chunk that is already running cannot be cancelled, so at most one chunk
+    per worker is in flight, and a new one is only started if the slowest chunk
+    so far would still finish in time. Work abandoned at the deadline is
+    therefore bounded and the next request does not queue behind it.
+    """
+    queue = deque(jobs)
+    running = {}
+    chunk_time = 0.0
+    try:
+        while queue or running:
+            now = time.monotonic()
+            while queue and len(running) < settings.RATING_BOOTSTRAP_WORKERS and now + chunk_time < deadline:
+                name, _, args = queue.popleft()
+                running[pool.submit(bootstrap_chunk, *args)] = (name, now)
+            remaining = deadline - now
+            if not running or remaining <= 0:
+                break
+            done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, started = running.pop(future)
+                chunk_time = max(chunk_time, time.monotonic() - started)
+                try:
+                    curves[name].append(future.result())
+                except BrokenProcessPool:
+                    raise
+                except Exception:
+                    logger.exception('Bootstrap chunk failed')
+    except BrokenProcessPool:
+        logger.exception('Bootstrap process pool is broken, starting a new one on the next request')
+        discard_pool(pool)
+        return
+    for future in running:
+        future.cancel()
+
+
+def bootstrap_bands(predictors, n_months=60, n_resamples=None, level=None, time_budget=None):
+    """
+    Residual-bootstrap prediction bands for trained predictors, keyed like the input.
+    Resamples for every predictor are fitted in chunks on the process pool and
+    collected until `time_budget` seconds have passed; each band reports how many
+    resamples it used, and is None if too few finished in time.
+    """
+    n_resamples = n_resamples or settings.RATING_BOOTSTRAP_RESAMPLES
+    level = level or settings.RATING_BOOTSTRAP_LEVEL
+    time_budget = time_budget if time_budget is not None else settings.RATING_BOOTSTRAP_TIME_BUDGET
+    chunk_size = settings.RATING_BOOTSTRAP_CHUNK
+    deadline = time.monotonic() + time_budget
+
+    bands = {}
+    jobs = []
+    for name, predictor in predictors.items():
+        if predictor is None:
+            bands[name] = None
+            continue
+        key = _cache_key(predictor, n_months, n_resamples, level)
+        cached = cache.get(key)
+        metrics.record_cache('prediction_bands', cached is not None)
+        if cached is not None:
+            bands[name] = cached
+            continue
+        t = predictor.t_train
+        fitted = logistic(t, *predictor.params)
+        residuals = predictor.y_train - fitted
+        residuals = residuals - residuals.mean()
+        t_future = predictor.future_months(n_months)
+        seeds = np.random.SeedSequence(int(key[-16:], 16)).spawn(-(-n_resamples // chunk_size))
+        for i, seed in enumerate(seeds):
+            size = min(chunk_size, n_resamples - i * chunk_size)
+            args = (t, fitted, residuals, t_future, size, seed, predictor.max_rating_ceiling)
+            jobs.append((name, key, args))
+
+    curves = {name: [] for name, _, _ in jobs}
+    pool = get_pool()
+    with metrics.timed('bootstrap_bands'):
+        if pool is None:
+            for name, _, args in jobs:
+                if time.monotonic() >= deadline:
+                    break
+                curves[name].append(bootstrap_chunk(*args))
+        else:
+            _run_on_pool(pool, jobs, curves, deadline)
+
+    keys = {name: key for name, key, _ in jobs}
+    for name, parts in curves.items():
+        samples = np.concatenate(parts) if parts else np.empty((0, n_months))
+        if len(samples) < MIN_RESAMPLES:
+            bands[name] = None
+            continue
+        tail = (1 - level) / 2 * 100
+        band = {
+            'lower': np.percentile(samples, tail, axis=0).tolist(),
+            'upper': np.percentile(samples, 100 - tail, axis=0).tolist(),
+            'level': level,
+            'resamples': len(samples),
+        }
+        # Only complete runs are cached, so a slow request never pins a thin band
+        if len(samples) >= n_resamples * 0.9:
+            cache.set(keys[name], band, settings.RATING_BOOTSTRAP_CACHE_TTL)
+        bands[name] = band
+    return bands
+
+
+def predict_variants_with_bands(rating_history_data, variants=('bullet', 'blitz', 'rapid'), n_months=60):
+    """predict_variants plus a 'bands' entry with bootstrap bands per variant"""
+    predictors = train_variants(rating_history_data, variants)
+    predictions = {
+        variant: predictor.predict_next_n(n_months=n_months) if predictor else []
+        for variant, predictor in predictors.items()
+    }
+    predictions['bands'] = bootstrap_bands(predictors, n_months=n_months)
+    return predictions
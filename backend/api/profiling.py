@@ -0,0 +1,61 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+# Seconds between stack samples of the profiled request thread
+SAMPLE_INTERVAL = 0.002
+
+
+class SamplingProfiler:
+    """
+    Sample the call stack of one thread from a background thread.
+    Results are folded stacks ("frame;frame;frame count" per line),
+    the input format of flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self.stacks[_fold(frame)] += 1
+
+    def folded(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def profile_call(func, *args, **kwargs):
+    """Run func under the sampling profiler, returning (result, folded stacks, seconds)"""
+    profiler = SamplingProfiler()
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.stop()
+    return result, profiler.folded(), time.perf_counter() - start
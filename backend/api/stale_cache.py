@@ -0,0 +1,85 @@
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from . import metrics
+from .circuit_breaker import UpstreamUnavailable
+from .lichess_client import is_outage_status
+from .models import LastKnownGood
+
+
+def is_outage(exc):
+    """True for errors that mean Lichess is unavailable, not that the request was bad"""
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and is_outage_status(exc.response.status_code)
+    return isinstance(exc, (UpstreamUnavailable, requests.ConnectionError, requests.Timeout))
+
+
+_last_prune = float('-inf')
+_prune_lock = threading.Lock()
+
+
+def _expiry():
+    return timezone.now() - timedelta(seconds=settings.STALE_DATA_TTL)
+
+
+def remember(key, data):
+    """
+    Store `data` as the last known good value for `key`, at most once per
+    STALE_DATA_REFRESH seconds. The age check is a plain read, so most
+    successful lookups never take the database write lock.
+    """
+    now = timezone.now()
+    fresh_since = now - timedelta(seconds=settings.STALE_DATA_REFRESH)
+    if LastKnownGood.objects.filter(key=key, fetched_at__gte=fresh_since).exists():
+        return
+    if not LastKnownGood.objects.filter(key=key).update(data=data, fetched_at=now):
+        try:
+            LastKnownGood.objects.create(key=key, data=data)
+        except IntegrityError:
+            pass  # another worker stored it first
+    _maybe_prune()
+
+
+def _maybe_prune():
+    """Prune expired values from the request path, at most once per STALE_DATA_REFRESH per process"""
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < settings.STALE_DATA_REFRESH:
+            return
+        _last_prune = time.monotonic()
+    prune_expired()
+
+
+def fetch_or_stale(key, fetch, *args):
+    """
+    Call fetch(*args) and remember the result as the last known good value.
+    If Lichess is unavailable, return that value instead. Values live in the
+    database, so every worker process can serve what any of them fetched;
+    they are refreshed at most every STALE_DATA_REFRESH seconds.
+    Returns (data, is_stale); re-raises when there is nothing to fall back to.
+    """
+    key = key.lower()
+    try:
+        data = fetch(*args)
+    except Exception as e:
+        if not is_outage(e):
+            raise
+        stored = LastKnownGood.objects.filter(key=key, fetched_at__gte=_expiry()).only('data').first()
+        metrics.record_cache('stale_fallback', stored is not None)
+        if stored is None:
+            raise
+        return stored.data, True
+    remember(key, data)
+    return data, False
+
+
+def prune_expired():
+    """Delete last known good values older than STALE_DATA_TTL; returns how many"""
+    deleted, _ = LastKnownGood.objects.filter(fetched_at__lt=_expiry()).delete()
+    return deleted
@@ -0,0 +1,75 @@
+import warnings
+
+import numpy as np
+from django.test import SimpleTestCase
+from scipy.optimize import curve_fit
+
+from api.batch_predictor import fit_logistic_batch
+from api.management.commands.bench_batch_fit import synthetic_series
+from api.rating_predictor import logistic
+
+
+def curve_fit_params(t, y, ceiling=2700):
+    """The per-series fit RatingPredictor.train does"""
+    max_rating = y.max()
+    p0 = [min(max_rating + 100, ceiling), 0.1, np.median(t)]
+    bounds = ([max_rating, 0.0001, t.min()], [ceiling, 1.0, t.max()])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        params, _ = curve_fit(logistic, t, y, p0=p0, bounds=bounds, maxfev=10000)
+    return params
+
+
+def curve_fit_cost(t, y, ceiling=2700):
+    """Sum of squared residuals of the curve_fit solution"""
+    return np.sum((logistic(t, *curve_fit_params(t, y, ceiling)) - y) ** 2)
+
+
+def well_conditioned_series(rng, count):
+    """Ten years of monthly points around an inflection mid-span, well below the ceiling"""
+    t = np.arange(120, dtype=float)
+    series = []
+    for _ in range(count):
+        L, k, t0 = rng.uniform(1600, 2300), rng.uniform(0.05, 0.2), rng.uniform(40, 80)
+        series.append((t, np.round(logistic(t, L, k, t0) + rng.normal(0, 20, len(t)))))
+    return series
+
+
+class FitLogisticBatchTests(SimpleTestCase):
+    def test_never_worse_than_curve_fit(self):
+        # Seed 1 includes series where a single start ends in the L=ceiling, t0=t.min corner
+        series = synthetic_series(np.random.default_rng(1), 300)
+        params = fit_logistic_batch(series)
+        for i, ((t, y), row) in enumerate(zip(series, params)):
+            batch_cost = np.sum((logistic(t, *row) - y) ** 2)
+            with self.subTest(series=i):
+                self.assertLessEqual(batch_cost, curve_fit_cost(t, y) * (1 + 1e-3) + 1e-6)
+
+    def test_matches_curve_fit_on_a_single_minimum(self):
+        # Both solvers land on the same optimum: parameters agree to rtol 1e-4
+        # and five-year forecasts to within 0.1 rating points
+        series = well_conditioned_series(np.random.default_rng(3), 50)
+        params = fit_logistic_batch(series)
+        future = np.arange(120, 180, dtype=float)
+        for i, ((t, y), row) in enumerate(zip(series, params)):
+            expected = curve_fit_params(t, y)
+            with self.subTest(series=i):
+                np.testing.assert_allclose(row, expected, rtol=1e-4)
+                np.testing.assert_allclose(logistic(future, *row), logistic(future, *expected), atol=0.1)
+
+    def test_params_within_bounds(self):
+        series = synthetic_series(np.random.default_rng(2), 50)
+        params = fit_logistic_batch(series)
+        for (t, y), (L, k, t0) in zip(series, params):
+            self.assertTrue(y.max() <= L <= 2700)
+            self.assertTrue(0.0001 <= k <= 1.0)
+            self.assertTrue(t.min() <= t0 <= t.max())
+
+    def test_unfittable_series_are_nan(self):
+        t = np.arange(10, dtype=float)
+        series = [
+            (t[:4], np.full(4, 1500.0)),      # too few points
+            (np.zeros(6), np.full(6, 1500.0)),  # no time span
+            (t, np.full(10, 2700.0)),         # at the ceiling
+        ]
+        self.assertTrue(np.isnan(fit_logistic_batch(series)).all())
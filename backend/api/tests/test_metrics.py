@@ -0,0 +1,21 @@
+import os
+
+from django.test import SimpleTestCase
+
+from api.metrics import Counter, Histogram, Registry
+
+
+class RegistryTests(SimpleTestCase):
+    def test_samples_are_labelled_with_worker(self):
+        registry = Registry()
+        counter = registry.register(Counter('calls_total', 'Calls', labels=('status',)))
+        histogram = registry.register(Histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0)))
+        counter.inc('200')
+        histogram.observe(0.5)
+        lines = registry.render().splitlines()
+        worker = f'worker="{os.getpid()}"'
+        self.assertIn(f'calls_total{{{worker},status="200"}} 1', lines)
+        self.assertIn(f'latency_seconds_bucket{{{worker},le="0.1"}} 0', lines)
+        self.assertIn(f'latency_seconds_bucket{{{worker},le="1.0"}} 1', lines)
+        self.assertIn(f'latency_seconds_bucket{{{worker},le="+Inf"}} 1', lines)
+        self.assertIn(f'latency_seconds_count{{{worker}}} 1', lines)
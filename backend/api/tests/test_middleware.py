@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import AnalyticsLog
+
+
+def client_for(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.admin = client_for(User.objects.create(username='admin', is_staff=True))
+
+    def profiles(self):
+        return AnalyticsLog.objects.filter(action='REQUEST_PROFILE')
+
+    def test_admin_request_is_profiled(self):
+        for kwargs in ({'path': '/api/user/?profile=1'}, {'path': '/api/user/', 'HTTP_X_PROFILE': 'true'}):
+            with self.subTest(**kwargs):
+                response = self.admin.get(**kwargs)
+                self.assertEqual(response.status_code, 200)
+                log = self.profiles().get(id=response['X-Profile-Id'])
+                self.assertEqual(log.user.username, 'admin')
+                self.assertIn('GET /api/user/', log.details)
+
+    def test_disabled_flag_is_not_profiled(self):
+        for kwargs in ({'path': '/api/user/?profile=0'}, {'path': '/api/user/', 'HTTP_X_PROFILE': '0'},
+                       {'path': '/api/user/?profile='}):
+            with self.subTest(**kwargs):
+                response = self.admin.get(**kwargs)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(self.profiles().exists())
+
+    def test_non_admin_is_not_profiled(self):
+        client = client_for(User.objects.create(username='alice'))
+        response = client.get('/api/user/?profile=1', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(self.profiles().exists())
+
+    def test_anonymous_is_not_profiled(self):
+        response = APIClient().get('/api/user/?profile=1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(self.profiles().exists())
@@ -0,0 +1,143 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from api import precompute
+from api.circuit_breaker import CircuitOpenError
+from api.models import DashboardSnapshot, PrecomputeFailure
+
+HOUR = 60 * 60
+
+
+def link(username, lichess_username, premium=False):
+    user = User.objects.create(username=username)
+    user.profile.lichess_username = lichess_username
+    user.profile.is_premium = premium
+    user.profile.save()
+    return user
+
+
+def snapshot(username, kind, age=0):
+    DashboardSnapshot.objects.create(lichess_username=username, kind=kind, data={})
+    DashboardSnapshot.objects.filter(lichess_username=username, kind=kind).update(
+        refreshed_at=timezone.now() - timedelta(seconds=age),
+    )
+
+
+class DueProfilesTests(TestCase):
+    def test_missing_snapshots_are_due(self):
+        link('alice', 'Alice')
+        self.assertEqual(list(precompute.due_profiles(HOUR)), [('alice', False)])
+
+    def test_fresh_account_is_not_due(self):
+        link('alice', 'alice')
+        for kind in precompute.SNAPSHOT_KINDS:
+            snapshot('alice', kind)
+        self.assertEqual(list(precompute.due_profiles(HOUR)), [])
+
+    def test_old_predictions_ignored_after_downgrade(self):
+        link('alice', 'alice', premium=False)
+        for kind in precompute.SNAPSHOT_KINDS:
+            snapshot('alice', kind)
+        snapshot('alice', 'predictions', age=10 * HOUR)
+        self.assertEqual(list(precompute.due_profiles(HOUR)), [])
+
+    def test_old_predictions_due_for_premium(self):
+        link('alice', 'alice', premium=True)
+        for kind in precompute.SNAPSHOT_KINDS:
+            snapshot('alice', kind)
+        snapshot('alice', 'predictions', age=10 * HOUR)
+        self.assertEqual(list(precompute.due_profiles(HOUR)), [('alice', True)])
+
+    def test_shared_account_listed_once(self):
+        link('free', 'shared')
+        link('paid', 'Shared', premium=True)
+        self.assertEqual(list(precompute.due_profiles(HOUR)), [('shared', True)])
+
+    def test_backing_off_account_is_skipped(self):
+        link('alice', 'alice')
+        PrecomputeFailure.objects.create(lichess_username='alice', failures=1,
+                                         retry_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(list(precompute.due_profiles(HOUR)), [])
+
+
+class RunPassTests(TestCase):
+    def run_pass(self, **patches):
+        with mock.patch.object(precompute, 'refresh_snapshots', **patches), \
+                mock.patch.object(precompute.time, 'sleep'):
+            return precompute.run_pass(HOUR, 60)
+
+    def test_failures_back_off_exponentially(self):
+        link('gone', 'gone')
+        with self.assertLogs('api.precompute', 'ERROR'):
+            self.run_pass(side_effect=RuntimeError('404 Not Found'))
+        failure = PrecomputeFailure.objects.get(lichess_username='gone')
+        self.assertEqual(failure.failures, 1)
+        self.assertIn('404', failure.last_error)
+        first_delay = failure.retry_at - timezone.now()
+
+        PrecomputeFailure.objects.update(retry_at=timezone.now())
+        with self.assertLogs('api.precompute', 'ERROR'):
+            self.run_pass(side_effect=RuntimeError('404 Not Found'))
+        failure.refresh_from_db()
+        self.assertEqual(failure.failures, 2)
+        self.assertGreater(failure.retry_at - timezone.now(), first_delay * 1.9)
+
+    def test_success_clears_failures(self):
+        link('alice', 'alice')
+        PrecomputeFailure.objects.create(lichess_username='alice', failures=3, retry_at=timezone.now())
+        self.assertEqual(self.run_pass(return_value=[]), 1)
+        self.assertFalse(PrecomputeFailure.objects.exists())
+
+    def test_outage_stops_pass_without_backing_off(self):
+        link('alice', 'alice')
+        link('bob', 'bob')
+        with mock.patch.object(precompute, 'refresh_snapshots', side_effect=CircuitOpenError('profile', 30)) as refresh, \
+                mock.patch.object(precompute.time, 'sleep'), self.assertLogs('api.precompute', 'WARNING'):
+            self.assertEqual(precompute.run_pass(HOUR, 60), 0)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertFalse(PrecomputeFailure.objects.exists())
+
+    def test_predictions_dropped_for_free_accounts(self):
+        link('alice', 'alice')
+        snapshot('alice', 'predictions')
+        self.run_pass(return_value=[])
+        self.assertFalse(DashboardSnapshot.objects.filter(kind='predictions').exists())
+
+
+class WarmUpTests(TestCase):
+    def setUp(self):
+        # The mocked thread never runs, so nothing would take the account off the set
+        self.addCleanup(precompute._warming.clear)
+
+    def warm_up(self, user):
+        with mock.patch.object(precompute.threading, 'Thread') as thread:
+            precompute.warm_up(user.profile)
+        return thread.called
+
+    def test_stale_account_is_warmed(self):
+        user = link('alice', 'alice')
+        for kind in precompute.SNAPSHOT_KINDS:
+            snapshot('alice', kind, age=10 * HOUR)
+        self.assertTrue(self.warm_up(user))
+
+    def test_fresh_account_is_not_refetched(self):
+        user = link('alice', 'alice')
+        for kind in precompute.SNAPSHOT_KINDS:
+            snapshot('alice', kind)
+        self.assertFalse(self.warm_up(user))
+
+    def test_premium_account_needs_fresh_predictions(self):
+        user = link('alice', 'alice', premium=True)
+        for kind in precompute.SNAPSHOT_KINDS:
+            snapshot('alice', kind)
+        self.assertTrue(self.warm_up(user))
+
+    def test_backing_off_account_is_not_warmed(self):
+        user = link('gone', 'gone')
+        PrecomputeFailure.objects.create(lichess_username='gone', failures=1,
+                                         retry_at=timezone.now() + timedelta(minutes=5))
+        self.assertFalse(self.warm_up(user))
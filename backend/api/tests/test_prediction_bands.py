@@ -0,0 +1,86 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import numpy as np
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from api import prediction_bands
+from api.prediction_bands import bootstrap_bands, bootstrap_chunk
+from api.rating_predictor import logistic, train_variants
+
+
+def blitz_predictor():
+    rng = np.random.default_rng(0)
+    points = [[2018 + m // 12, m % 12, 1, int(1500 + 600 / (1 + np.exp(-0.08 * (m - 30))) + rng.normal(0, 30))]
+              for m in range(70)]
+    return train_variants([{'name': 'Blitz', 'points': points}], ('blitz',))
+
+
+class FakePool:
+    """Runs chunks inline, or leaves every future pending when hang=True"""
+
+    def __init__(self, broken=False, hang=False):
+        self.broken = broken
+        self.hang = hang
+        self.submitted = 0
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool('a worker died'))
+        elif not self.hang:
+            future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@override_settings(RATING_BOOTSTRAP_WORKERS=2, RATING_BOOTSTRAP_CHUNK=50)
+class BootstrapBandsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(setattr, prediction_bands, '_pool', None)
+
+    def test_bands_from_pool(self):
+        prediction_bands._pool = FakePool()
+        bands = bootstrap_bands(blitz_predictor(), n_months=12, n_resamples=200, time_budget=30)
+        self.assertEqual(bands['blitz']['resamples'], 200)
+        self.assertTrue(all(lo <= hi for lo, hi in zip(bands['blitz']['lower'], bands['blitz']['upper'])))
+
+    def test_broken_pool_is_replaced(self):
+        pool = prediction_bands._pool = FakePool(broken=True)
+        with self.assertLogs('api.prediction_bands', 'ERROR'):
+            bands = bootstrap_bands(blitz_predictor(), n_months=12, n_resamples=200, time_budget=30)
+        self.assertIsNone(bands['blitz'])
+        self.assertTrue(pool.shut_down)
+        self.assertIsNone(prediction_bands._pool)
+
+    def test_at_most_one_chunk_per_worker_in_flight(self):
+        pool = prediction_bands._pool = FakePool(hang=True)
+        bands = bootstrap_bands(blitz_predictor(), n_months=12, n_resamples=400, time_budget=0.05)
+        self.assertIsNone(bands['blitz'])
+        self.assertEqual(pool.submitted, 2)
+
+
+class BootstrapChunkTests(SimpleTestCase):
+    def test_resamples_near_the_ceiling_are_kept(self):
+        t = np.arange(40, dtype=float)
+        fitted = logistic(t, 2680, 0.2, 10)
+        residuals = np.random.default_rng(0).normal(0, 40, len(t))
+        curves = bootstrap_chunk(t, fitted, residuals - residuals.mean(), np.arange(41, 50, dtype=float),
+                                 100, np.random.SeedSequence(1), 2700)
+        self.assertEqual(curves.shape, (100, 9))
+        self.assertTrue((curves <= 2700).all())
+
+    def test_records_no_metrics(self):
+        # Runs in pool workers, whose metrics would never be exported
+        t = np.arange(20, dtype=float)
+        with mock.patch('api.batch_predictor.metrics.timed') as timed:
+            bootstrap_chunk(t, logistic(t, 1800, 0.2, 5), np.zeros(len(t)), t + 20, 10,
+                            np.random.SeedSequence(0), 2700)
+        timed.assert_not_called()
@@ -0,0 +1,71 @@
+from datetime import timedelta
+from unittest import mock
+
+import requests
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api import stale_cache
+from api.circuit_breaker import CircuitOpenError
+from api.models import LastKnownGood
+from api.stale_cache import fetch_or_stale, prune_expired
+
+
+def http_error(status_code):
+    return requests.HTTPError(f'{status_code} error', response=mock.Mock(status_code=status_code))
+
+
+class FetchOrStaleTests(TestCase):
+    def test_fresh_data_is_stored(self):
+        data, stale = fetch_or_stale('rating_history:Alice', lambda: [{'name': 'Blitz'}])
+        self.assertEqual((data, stale), ([{'name': 'Blitz'}], False))
+        self.assertEqual(LastKnownGood.objects.get(key='rating_history:alice').data, [{'name': 'Blitz'}])
+
+    def test_recent_value_is_not_rewritten(self):
+        fetch_or_stale('profile:alice', lambda: {'id': 'alice'})
+        # One read to check the age; no write transaction
+        with self.assertNumQueries(1):
+            data, stale = fetch_or_stale('profile:alice', lambda: {'id': 'alice', 'new': True})
+        self.assertEqual(LastKnownGood.objects.get().data, {'id': 'alice'})
+
+    @override_settings(STALE_DATA_REFRESH=60)
+    def test_old_value_is_refreshed(self):
+        fetch_or_stale('profile:alice', lambda: {'id': 'alice'})
+        LastKnownGood.objects.update(fetched_at=timezone.now() - timedelta(minutes=5))
+        fetch_or_stale('profile:alice', lambda: {'id': 'alice', 'new': True})
+        stored = LastKnownGood.objects.get()
+        self.assertEqual(stored.data, {'id': 'alice', 'new': True})
+        self.assertGreater(stored.fetched_at, timezone.now() - timedelta(minutes=1))
+
+    @override_settings(STALE_DATA_TTL=60)
+    def test_writes_prune_expired_values(self):
+        LastKnownGood.objects.create(key='profile:old', data={})
+        LastKnownGood.objects.update(fetched_at=timezone.now() - timedelta(minutes=5))
+        with mock.patch.object(stale_cache, '_last_prune', float('-inf')):
+            fetch_or_stale('profile:alice', lambda: {'id': 'alice'})
+        self.assertEqual(list(LastKnownGood.objects.values_list('key', flat=True)), ['profile:alice'])
+
+    def test_outage_serves_last_known_good(self):
+        fetch_or_stale('profile:alice', lambda: {'id': 'alice'})
+        for error in (http_error(503), http_error(429), requests.Timeout(), CircuitOpenError('profile', 10)):
+            with self.subTest(error=error):
+                data, stale = fetch_or_stale('profile:alice', mock.Mock(side_effect=error))
+                self.assertEqual((data, stale), ({'id': 'alice'}, True))
+
+    def test_client_errors_are_not_masked(self):
+        fetch_or_stale('profile:alice', lambda: {'id': 'alice'})
+        with self.assertRaises(requests.HTTPError):
+            fetch_or_stale('profile:alice', mock.Mock(side_effect=http_error(404)))
+
+    def test_outage_without_data_reraises(self):
+        with self.assertRaises(requests.Timeout):
+            fetch_or_stale('profile:nobody', mock.Mock(side_effect=requests.Timeout()))
+
+    @override_settings(STALE_DATA_TTL=60)
+    def test_expired_data_is_not_served_and_pruned(self):
+        fetch_or_stale('profile:alice', lambda: {'id': 'alice'})
+        LastKnownGood.objects.update(fetched_at=timezone.now() - timedelta(minutes=5))
+        with self.assertRaises(requests.Timeout):
+            fetch_or_stale('profile:alice', mock.Mock(side_effect=requests.Timeout()))
+        self.assertEqual(prune_expired(), 1)
+        self.assertFalse(LastKnownGood.objects.exists())
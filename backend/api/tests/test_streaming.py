@@ -0,0 +1,87 @@
+import gc
+from unittest import mock
+
+import requests
+from django.conf import settings
+from django.test import SimpleTestCase
+from rest_framework.test import APIClient
+
+from api import lichess_client, upstream_scheduler
+
+
+class FakeStream:
+    """Stands in for a requests.Response opened with stream=True"""
+
+    def __init__(self, status_code=200, chunks=(b'{"id":"a"}\n', b'', b'{"id":"b"}\n')):
+        self.status_code = status_code
+        self.headers = {'content-type': 'application/x-ndjson'}
+        self.chunks = chunks
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} error', response=self)
+
+    def iter_content(self, chunk_size=None):
+        yield from self.chunks
+
+    def close(self):
+        self.closed = True
+
+
+class StreamedExportTests(SimpleTestCase):
+    def setUp(self):
+        # A scheduler of its own, so in_flight only counts this test's calls
+        budget = upstream_scheduler.process_budget(settings.LICHESS_SCHEDULER)
+        self.scheduler = upstream_scheduler.UpstreamScheduler(*budget)
+        patcher = mock.patch.object(upstream_scheduler, '_scheduler', self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def get(self, url, upstream):
+        with mock.patch.object(lichess_client.requests, 'get', return_value=upstream):
+            return self.client.get(url)
+
+    def open_stream(self, upstream):
+        with mock.patch.object(lichess_client.requests, 'get', return_value=upstream):
+            return lichess_client.stream_game_export('abc')
+
+    def test_closing_unread_response_releases_slot(self):
+        upstream = FakeStream()
+        response = self.get('/api/games/alice/?max=5', upstream)
+        self.assertEqual(response.status_code, 200)
+        # Slow readers hold the slot, so streams never take an interactive one
+        self.assertEqual(self.scheduler.class_in_flight[upstream_scheduler.BULK], 1)
+        # What the WSGI server does when the client disconnects before the first chunk
+        response.close()
+        self.assertEqual(self.scheduler.in_flight, 0)
+        self.assertTrue(upstream.closed)
+
+    def test_reading_whole_body_releases_slot(self):
+        upstream = FakeStream()
+        response = self.get('/api/game/abc/export/', upstream)
+        self.assertEqual(b''.join(response.streaming_content), b'{"id":"a"}\n{"id":"b"}\n')
+        self.assertEqual(self.scheduler.in_flight, 0)
+        self.assertTrue(upstream.closed)
+
+    def test_dropped_stream_releases_slot_without_gc(self):
+        upstream = FakeStream()
+        gc.disable()
+        self.addCleanup(gc.enable)
+        _, stream = self.open_stream(upstream)
+        del stream
+        self.assertEqual(self.scheduler.in_flight, 0)
+        self.assertTrue(upstream.closed)
+
+    def test_upstream_error_releases_slot(self):
+        upstream = FakeStream(status_code=404)
+        response = self.get('/api/games/alice/', upstream)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.scheduler.in_flight, 0)
+        self.assertTrue(upstream.closed)
+
+    def test_max_below_one_rejected(self):
+        response = self.get('/api/games/alice/?max=-5', FakeStream())
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.scheduler.in_flight, 0)
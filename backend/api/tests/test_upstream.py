@@ -0,0 +1,208 @@
+import time
+from collections import deque
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from api import lichess_client
+from api.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from api.upstream_scheduler import (
+    BACKGROUND, BULK, INTERACTIVE_FREE, INTERACTIVE_PREMIUM, QueueTimeout, Ticket, TokenBucket, UpstreamScheduler,
+    process_budget,
+)
+
+
+def make_scheduler(max_concurrency=4, **overrides):
+    classes = {
+        INTERACTIVE_PREMIUM: {'concurrency': 4, 'rate': 1000, 'burst': 1000, 'queue_timeout': 0.05},
+        INTERACTIVE_FREE: {'concurrency': 2, 'rate': 1000, 'burst': 1000, 'queue_timeout': 0.05},
+        BULK: {'concurrency': 1, 'rate': 1000, 'burst': 1000, 'queue_timeout': 0.05},
+        BACKGROUND: {'concurrency': 1, 'rate': 1000, 'burst': 1000, 'queue_timeout': 0.05},
+    }
+    for priority, config in overrides.items():
+        classes[priority] = {**classes[priority], **config}
+    return UpstreamScheduler(max_concurrency, classes)
+
+
+def enqueue(scheduler, priority, user):
+    """Queue a ticket without blocking, as acquire() does before waiting"""
+    ticket = Ticket(priority, user)
+    scheduler.queues[priority].setdefault(user, deque()).append(ticket)
+    return ticket
+
+
+class UpstreamSchedulerTests(SimpleTestCase):
+    def test_class_concurrency_limit(self):
+        scheduler = make_scheduler()
+        slots = [scheduler.acquire(INTERACTIVE_FREE, 'a') for _ in range(2)]
+        with self.assertRaises(QueueTimeout):
+            scheduler.acquire(INTERACTIVE_FREE, 'a')
+        slots[0].release()
+        scheduler.acquire(INTERACTIVE_FREE, 'a')
+
+    def test_release_is_idempotent(self):
+        scheduler = make_scheduler()
+        slot = scheduler.acquire(BACKGROUND)
+        slot.release()
+        slot.release()
+        self.assertEqual(scheduler.in_flight, 0)
+        self.assertEqual(scheduler.class_in_flight[BACKGROUND], 0)
+
+    def test_rate_limit(self):
+        scheduler = make_scheduler(**{BACKGROUND: {'rate': 0.01, 'burst': 1}})
+        scheduler.acquire(BACKGROUND).release()
+        with self.assertRaises(QueueTimeout) as ctx:
+            scheduler.acquire(BACKGROUND)
+        self.assertGreater(ctx.exception.retry_after, 1)
+
+    def test_higher_priority_dispatched_first(self):
+        scheduler = make_scheduler(max_concurrency=1)
+        with scheduler._cond:
+            background = enqueue(scheduler, BACKGROUND, 'worker')
+            premium = enqueue(scheduler, INTERACTIVE_PREMIUM, 'p')
+            scheduler._dispatch()
+        self.assertTrue(premium.granted)
+        self.assertFalse(background.granted)
+
+    def test_round_robin_between_users(self):
+        scheduler = make_scheduler(max_concurrency=1)
+        with scheduler._cond:
+            bulk = [enqueue(scheduler, INTERACTIVE_FREE, 'bulk') for _ in range(3)]
+            other = enqueue(scheduler, INTERACTIVE_FREE, 'other')
+            scheduler._dispatch()
+            self.assertEqual([t.granted for t in bulk + [other]], [True, False, False, False])
+        scheduler._release(INTERACTIVE_FREE)
+        self.assertTrue(other.granted)
+        self.assertFalse(bulk[1].granted)
+
+    def test_lower_classes_leave_headroom_for_premium(self):
+        scheduler = make_scheduler(
+            max_concurrency=4,
+            **{
+                INTERACTIVE_FREE: {'concurrency': 3, 'headroom': 1},
+                BULK: {'headroom': 2},
+                BACKGROUND: {'concurrency': 2, 'headroom': 2},
+            }
+        )
+        scheduler.acquire(BACKGROUND, 'worker')
+        scheduler.acquire(BACKGROUND, 'worker')
+        scheduler.acquire(INTERACTIVE_FREE, 'a')
+        with self.assertRaises(QueueTimeout):
+            scheduler.acquire(INTERACTIVE_FREE, 'b')
+        with self.assertRaises(QueueTimeout):
+            scheduler.acquire(BULK, 'c')
+        scheduler.acquire(INTERACTIVE_PREMIUM, 'p')
+
+    def test_default_settings_keep_slots_for_premium(self):
+        config = settings.LICHESS_SCHEDULER
+        scheduler = UpstreamScheduler(config['max_concurrency'], config['classes'])
+        scheduler.buckets = {p: TokenBucket(1000, 1000) for p in scheduler.buckets}
+        for priority in (BACKGROUND, BULK, INTERACTIVE_FREE):
+            for i in range(config['max_concurrency']):
+                with scheduler._cond:
+                    enqueue(scheduler, priority, f'{priority}-{i}')
+        with scheduler._cond:
+            scheduler._dispatch()
+        self.assertLess(scheduler.in_flight, config['max_concurrency'])
+        scheduler.acquire(INTERACTIVE_PREMIUM, 'p')
+
+    def test_timed_out_ticket_is_withdrawn(self):
+        scheduler = make_scheduler()
+        scheduler.acquire(BACKGROUND)
+        with self.assertRaises(QueueTimeout):
+            scheduler.acquire(BACKGROUND, 'worker')
+        self.assertEqual(len(scheduler.queues[BACKGROUND]), 0)
+
+
+class ProcessBudgetTests(SimpleTestCase):
+    def test_single_process_gets_whole_budget(self):
+        config = settings.LICHESS_SCHEDULER
+        max_concurrency, classes = process_budget({**config, 'processes': 1})
+        self.assertEqual(max_concurrency, config['max_concurrency'])
+        self.assertEqual(classes[INTERACTIVE_FREE]['rate'], config['classes'][INTERACTIVE_FREE]['rate'])
+
+    def test_budget_split_across_processes(self):
+        config = {**settings.LICHESS_SCHEDULER, 'processes': 4, 'max_concurrency': 8}
+        max_concurrency, classes = process_budget(config)
+        self.assertEqual(max_concurrency, 2)
+        for priority, limits in classes.items():
+            total_rate = limits['rate'] * config['processes']
+            self.assertAlmostEqual(total_rate, config['classes'][priority]['rate'])
+            self.assertGreaterEqual(limits['concurrency'], 1)
+        # Premium keeps a slot of its own and every other class can still run
+        for priority in (INTERACTIVE_FREE, BULK, BACKGROUND):
+            self.assertEqual(classes[priority]['headroom'], 1)
+        self.assertEqual(classes[INTERACTIVE_PREMIUM]['headroom'], 0)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker('test', failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_half_open_failure_reopens(self):
+        breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=0.01)
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_cancelled_trial_frees_its_place(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.cancel_call()
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+
+
+class LichessGetTests(SimpleTestCase):
+    def test_open_circuit_does_not_queue_or_spend_tokens(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        with mock.patch.object(lichess_client, 'get_breaker', return_value=breaker), \
+                mock.patch.object(lichess_client.upstream_scheduler, 'acquire') as acquire, \
+                mock.patch.object(lichess_client.requests, 'get') as requests_get:
+            with self.assertRaises(CircuitOpenError):
+                lichess_client.get('test', 'https://lichess.org/api/test')
+        acquire.assert_not_called()
+        requests_get.assert_not_called()
+
+    def test_queue_timeout_cancels_half_open_trial(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        timeout = QueueTimeout(INTERACTIVE_FREE, 1)
+        with mock.patch.object(lichess_client, 'get_breaker', return_value=breaker), \
+                mock.patch.object(lichess_client.upstream_scheduler, 'acquire', side_effect=timeout):
+            with self.assertRaises(QueueTimeout):
+                lichess_client.get('test', 'https://lichess.org/api/test')
+        self.assertEqual(breaker.trials, 0)
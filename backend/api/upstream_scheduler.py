@@ -0,0 +1,240 @@
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from . import metrics
+from .circuit_breaker import UpstreamUnavailable
+
+# Priority classes, highest first
+INTERACTIVE_PREMIUM = 'interactive_premium'
+INTERACTIVE_FREE = 'interactive_free'
+BULK = 'bulk'
+BACKGROUND = 'background'
+PRIORITIES = (INTERACTIVE_PREMIUM, INTERACTIVE_FREE, BULK, BACKGROUND)
+
+_current = ContextVar('upstream_priority', default=(INTERACTIVE_FREE, None))
+
+
+class QueueTimeout(UpstreamUnavailable):
+    """Raised when a call waited longer than its class's queue timeout"""
+
+    def __init__(self, priority, retry_after):
+        super().__init__(f'Lichess request budget exhausted for {priority} requests', retry_after)
+        self.priority = priority
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Ticket:
+    __slots__ = ('priority', 'user', 'enqueued_at', 'granted')
+
+    def __init__(self, priority, user):
+        self.priority = priority
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class Slot:
+    """A granted upstream call; release() is safe to call more than once"""
+
+    def __init__(self, scheduler, priority):
+        self._scheduler = scheduler
+        self._priority = priority
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release(self._priority)
+
+
+class UpstreamScheduler:
+    """
+    Admission control for the Lichess calls of one process. Each priority
+    class has a concurrency limit and a token-bucket rate; within a class,
+    waiting users are served round-robin so one bulk user cannot starve the
+    others. Higher classes are always dispatched first, and everything shares
+    one max_concurrency limit. A class's `headroom` is the number of those
+    slots it must leave free, so lower classes cannot hold every slot while
+    higher ones are idle and then make them wait for a long call to finish.
+    """
+
+    def __init__(self, max_concurrency, classes):
+        self.max_concurrency = max_concurrency
+        self.classes = classes
+        self.in_flight = 0
+        self.class_in_flight = {priority: 0 for priority in PRIORITIES}
+        self.buckets = {p: TokenBucket(c['rate'], c['burst']) for p, c in classes.items()}
+        self.queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._cond = threading.Condition()
+
+    def acquire(self, priority, user=None):
+        """Block until a call of this priority may go upstream and return its Slot"""
+        ticket = Ticket(priority, user)
+        timeout = self.classes[priority]['queue_timeout']
+        with self._cond:
+            self.queues[priority].setdefault(user, deque()).append(ticket)
+            while True:
+                wake_in = self._dispatch()
+                if ticket.granted:
+                    break
+                waited = time.monotonic() - ticket.enqueued_at
+                if waited >= timeout:
+                    self._withdraw(ticket)
+                    metrics.scheduler_timeouts.inc(priority)
+                    raise QueueTimeout(priority, self.buckets[priority].wait_time() + 1)
+                remaining = timeout - waited
+                self._cond.wait(min(remaining, wake_in) if wake_in is not None else remaining)
+        metrics.scheduler_queue_duration.observe(time.monotonic() - ticket.enqueued_at, priority)
+        return Slot(self, priority)
+
+    def _dispatch(self):
+        """
+        Grant waiting tickets while capacity allows. Returns seconds until a
+        rate-limited class gets its next token, or None if none is waiting on one.
+        """
+        granted = False
+        wake_in = None
+        now = time.monotonic()
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            bucket = self.buckets[priority]
+            bucket.refill(now)
+            config = self.classes[priority]
+            limit = self.max_concurrency - config.get('headroom', 0)
+            while queue and self.in_flight < limit:
+                if self.class_in_flight[priority] >= config['concurrency']:
+                    break
+                if bucket.tokens < 1:
+                    wait = bucket.wait_time()
+                    wake_in = wait if wake_in is None else min(wake_in, wait)
+                    break
+                user, tickets = next(iter(queue.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    queue.move_to_end(user)
+                else:
+                    del queue[user]
+                bucket.tokens -= 1
+                self.in_flight += 1
+                self.class_in_flight[priority] += 1
+                ticket.granted = True
+                granted = True
+        if granted:
+            self._cond.notify_all()
+        return wake_in
+
+    def _withdraw(self, ticket):
+        tickets = self.queues[ticket.priority].get(ticket.user)
+        if tickets is not None:
+            tickets.remove(ticket)
+            if not tickets:
+                del self.queues[ticket.priority][ticket.user]
+
+    def _release(self, priority):
+        with self._cond:
+            self.in_flight -= 1
+            self.class_in_flight[priority] -= 1
+            self._dispatch()
+            self._cond.notify_all()
+
+
+def process_budget(config):
+    """
+    This process's share of the global LICHESS_SCHEDULER budget, split evenly
+    over config['processes']. Returns (max_concurrency, classes). Every class
+    keeps at least one slot, and headroom is rounded up so premium users
+    still have a slot held back while max_concurrency allows it.
+    """
+    processes = config.get('processes', 1)
+    max_concurrency = max(1, config['max_concurrency'] // processes)
+    classes = {}
+    for priority, limits in config['classes'].items():
+        classes[priority] = {
+            **limits,
+            'concurrency': max(1, limits['concurrency'] // processes),
+            'rate': limits['rate'] / processes,
+            'burst': max(1, limits['burst'] // processes),
+            'headroom': min(math.ceil(limits.get('headroom', 0) / processes), max_concurrency - 1),
+        }
+    return max_concurrency, classes
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The scheduler for this process, holding its share of the global budget"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = UpstreamScheduler(*process_budget(settings.LICHESS_SCHEDULER))
+        return _scheduler
+
+
+def acquire():
+    """Acquire an upstream slot for the priority and user of the current context"""
+    priority, user = _current.get()
+    return get_scheduler().acquire(priority, user)
+
+
+@contextmanager
+def upstream_priority(priority, user=None):
+    """Run Lichess calls in the enclosed block under `priority`, queued fairly per `user`"""
+    token = _current.set((priority, user))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def request_priority(request):
+    """Priority class and fairness key for an API request"""
+    user = request.user
+    if user.is_authenticated:
+        premium = user.is_superuser or getattr(getattr(user, 'profile', None), 'is_premium', False)
+        return (INTERACTIVE_PREMIUM if premium else INTERACTIVE_FREE), f'user:{user.id}'
+    return INTERACTIVE_FREE, f'ip:{request.META.get("REMOTE_ADDR")}'
+
+
+def prioritized(view):
+    """View decorator (below @api_view) running the view's Lichess calls at the caller's priority"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with upstream_priority(*request_priority(request)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def bulk_prioritized(view):
+    """
+    View decorator (below @api_view) for streamed exports. A streamed call holds
+    its slot for as long as the client takes to read the body, so these run in
+    the bulk class whoever asks, still queued fairly per caller.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with upstream_priority(BULK, request_priority(request)[1]):
+            return view(request, *args, **kwargs)
+    return wrapper
@@ -15,11 +15,14 @@ urlpatterns = [
     path('admin/users/<int:user_id>/toggle-premium/', views.toggle_premium, name='toggle_premium'),
     path('admin/users/<int:user_id>/toggle-active/', views.toggle_user_active, name='toggle_active'),
     path('admin/analytics/', views.get_analytics, name='analytics'),
+    path('admin/metrics/', views.metrics_view, name='metrics'),
     
     # User endpoints
     path('request-premium/', views.request_premium, name='request_premium'),
     
     # Lichess data endpoints (your existing ones)
+    path('games/<str:username>/', views.user_games, name='user_games'),
+    path('game/<str:game_id>/export/', views.export_pgn, name='export_pgn'),
     path('user-profile/<str:username>/', views.user_profile, name='user_profile'),
     path('rating-history/<str:username>/', views.rating_history, name='rating_history'),
     path('predict-future-ratings/<str:username>/', views.predict_future_ratings, name='predict_future_ratings'),
@@ -7,15 +7,22 @@ from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.utils import timezone
 from django.db.models import Count, Q
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from datetime import timedelta
 import os
 from collections import defaultdict
 from datetime import datetime
 
-from . import lichess_client
+from . import lichess_client, metrics
 from .lichess_client import fetch_rating_history, fetch_user_profile
-from .rating_predictor import RatingPredictor
-from .lichess_opening_stats import analyze_openings
+from .rating_predictor import predict_variants
+from .prediction_bands import predict_variants_with_bands, warm_pool
+from .circuit_breaker import UpstreamUnavailable
+from .stale_cache import fetch_or_stale
+from .upstream_scheduler import bulk_prioritized, prioritized
+from .lichess_opening_stats import opening_repertoire
+from .precompute import get_snapshot, wants_predictions, warm_up
 from .serializers import (
     UserSerializer, RegisterSerializer, UserManagementSerializer, 
     AnalyticsLogSerializer, UserProfileSerializer
@@ -25,16 +32,40 @@ from .models import UserProfile, AnalyticsLog
 
 # Middleware to log user activity
 def log_analysis(user, action, details=''):
-    AnalyticsLog.objects.create(
-        user=user,
-        action=action,
-        details=details
-    )
-    if user.is_authenticated:
-        profile = user.profile
-        profile.total_analyses += 1
-        profile.last_login = timezone.now()
-        profile.save()
+    with metrics.timed('log_analysis'):
+        AnalyticsLog.objects.create(
+            user=user,
+            action=action,
+            details=details
+        )
+        if user.is_authenticated:
+            profile = user.profile
+            profile.total_analyses += 1
+            profile.last_login = timezone.now()
+            profile.save()
+
+
+def lichess_response(data, stale):
+    response = Response(data)
+    if stale:
+        # Lichess is unavailable; this is the last known good data
+        response['X-Data-Stale'] = 'true'
+        response['Warning'] = '110 - "Response is Stale"'
+    return response
+
+
+def lichess_unavailable(e):
+    response = Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(int(e.retry_after) + 1)
+    return response
+
+
+def streaming_response(chunks, content_type):
+    # Chunks are relayed as Lichess sends them, so memory stays flat however many games are exported
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-store'
+    return response
 
 
 # ========== Basic API Endpoints ==========
@@ -45,6 +76,7 @@ def health(request):
 
 
 @api_view(['GET'])
+@prioritized
 def account(request):
     token = request.query_params.get('token') or os.environ.get('LICHESS_TOKEN')
     if not token:
@@ -57,48 +89,73 @@ def account(request):
 
 
 @api_view(['GET'])
+@bulk_prioritized
 def user_games(request, username):
     token = request.query_params.get('token') or os.environ.get('LICHESS_TOKEN')
-    maxg = request.query_params.get('max') or 10
     try:
-        data = lichess_client.fetch_user_games(username, token, maxg)
-        return Response({'games': data})
+        maxg = min(int(request.query_params.get('max') or 10), settings.MAX_EXPORT_GAMES)
+    except ValueError:
+        return Response({'error': 'max must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if maxg < 1:
+        return Response({'error': 'max must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+    pgn = request.query_params.get('format') == 'pgn'
+    try:
+        content_type, chunks = lichess_client.stream_user_games(username, token, maxg, pgn=pgn)
+    except UpstreamUnavailable as e:
+        return lichess_unavailable(e)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return streaming_response(chunks, content_type)
 
 
 @api_view(['GET'])
+@bulk_prioritized
 def export_pgn(request, game_id):
     token = request.query_params.get('token') or os.environ.get('LICHESS_TOKEN')
     try:
-        pgn = lichess_client.export_game(game_id, token)
-        return Response(pgn, content_type='text/plain')
+        content_type, chunks = lichess_client.stream_game_export(game_id, token)
+    except UpstreamUnavailable as e:
+        return lichess_unavailable(e)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return streaming_response(chunks, content_type)
 
 
 # ========== Lichess Data Endpoints ==========
 
 @api_view(['GET'])
+@prioritized
 def rating_history(request, username):
+    snapshot = get_snapshot(username, 'rating_history')
+    if snapshot is not None:
+        return Response(snapshot)
     try:
-        data = fetch_rating_history(username)
-        return Response(data)
+        data, stale = fetch_or_stale(f'rating_history:{username}', fetch_rating_history, username)
+        return lichess_response(data, stale)
+    except UpstreamUnavailable as e:
+        return lichess_unavailable(e)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['GET'])
+@prioritized
 def user_profile(request, username):
+    snapshot = get_snapshot(username, 'profile')
+    if snapshot is not None:
+        return Response(snapshot)
     try:
-        data = fetch_user_profile(username)
-        return Response(data)
+        data, stale = fetch_or_stale(f'user_profile:{username}', fetch_user_profile, username)
+        return lichess_response(data, stale)
+    except UpstreamUnavailable as e:
+        return lichess_unavailable(e)
     except Exception as e:
         return Response({"error": str(e)}, status=400)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@prioritized
 def predict_future_ratings(request, username):
     # Create profile if doesn't exist
     if not hasattr(request.user, 'profile'):
@@ -114,34 +171,37 @@ def predict_future_ratings(request, username):
     # Log the analysis
     log_analysis(request.user, 'RATING_PREDICTION', f'Predicted ratings for {username}')
 
+    # Optional bootstrap confidence bands, bounded by RATING_BOOTSTRAP_TIME_BUDGET
+    with_bands = request.query_params.get('bands') in ('1', 'true')
+    if not with_bands:
+        snapshot = get_snapshot(username, 'predictions')
+        if snapshot is not None:
+            return Response(snapshot)
+
     try:
-        rating_history_data = fetch_rating_history(username)
-        variants_to_predict = ['bullet', 'blitz', 'rapid']
-        predictions = {}
-
-        for variant in variants_to_predict:
-            variant_data = next((v for v in rating_history_data if v['name'].lower() == variant), None)
-            if not variant_data or not variant_data.get('points'):
-                predictions[variant] = []
-                continue
-
-            predictor = RatingPredictor()
-            predictor.train(variant_data['points'])
-            pred = predictor.predict_next_n(n_months=60)
-            predictions[variant] = pred
-
-        return Response(predictions)
+        rating_history_data, stale = fetch_or_stale(f'rating_history:{username}', fetch_rating_history, username)
+        if with_bands:
+            predictions = predict_variants_with_bands(rating_history_data)
+        else:
+            predictions = predict_variants(rating_history_data)
+        return lichess_response(predictions, stale)
+    except UpstreamUnavailable as e:
+        return lichess_unavailable(e)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @api_view(['GET'])
+@prioritized
 def opening_repertoire_view(request, username):
+    snapshot = get_snapshot(username, 'openings')
+    if snapshot is not None:
+        return Response(snapshot)
     try:
-        stats = analyze_openings(username)
-        # Convert defaultdict structure to regular dict for JSON serialization
-        stats = {color: dict(openings) for color, openings in stats.items()}
-        return Response(stats)
+        stats, stale = fetch_or_stale(f'openings:{username}', opening_repertoire, username)
+        return lichess_response(stats, stale)
+    except UpstreamUnavailable as e:
+        return lichess_unavailable(e)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -165,6 +225,12 @@ def login_view(request):
     user = authenticate(username=username, password=password)
     
     if user is not None:
+        # Precompute the user's own dashboard while the frontend loads
+        if hasattr(user, 'profile'):
+            warm_up(user.profile)
+            if wants_predictions(user.profile):
+                # Bootstrap workers take a moment to start; have them ready for ?bands=1
+                warm_pool()
         refresh = RefreshToken.for_user(user)
         return Response({
             'refresh': str(refresh),
@@ -280,7 +346,7 @@ def get_analytics(request):
     new_users = User.objects.filter(date_joined__gte=thirty_days_ago).count()
     
     # Recent activity logs
-    recent_logs = AnalyticsLog.objects.all()[:50]
+    recent_logs = AnalyticsLog.objects.defer('profile_data')[:50]
     
     # User growth over time (last 12 months)
     user_growth = []
@@ -303,6 +369,13 @@ def get_analytics(request):
     })
 
 
+# Admin: Prometheus metrics for this worker
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def metrics_view(request):
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # User: Request premium upgrade
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
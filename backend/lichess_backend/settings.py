@@ -2,6 +2,8 @@ import os
 from pathlib import Path
 from datetime import timedelta
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key')
@@ -23,11 +25,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -39,6 +43,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 SIMPLE_JWT = {
@@ -68,13 +76,120 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'lichess_backend.wsgi.application'
 
-DATABASES = {
+# Database profile, chosen with DB_PROFILE:
+#   sqlite        - WAL journal, tuned pragmas, busy timeout, persistent connections (default)
+#   sqlite-basic  - stock Django SQLite settings, for comparison
+#   postgres      - PostgreSQL with a psycopg connection pool (pip install "psycopg[binary,pool]")
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3')
+
+if DB_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+            'OPTIONS': {
+                # Seconds a writer waits on a locked database before "database is locked"
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+                # Take the write lock when a transaction starts, so it cannot deadlock on upgrade
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=134217728;'
+                ),
+            },
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+elif DB_PROFILE == 'sqlite-basic':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+        }
+    }
+elif DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'lichess'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                },
+            },
+            # The pool keeps connections open; Django's own persistence must stay off
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'Unknown DB_PROFILE {DB_PROFILE!r}')
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 
+# Lichess circuit breaker: consecutive failures before opening, seconds before a trial call
+LICHESS_BREAKER_FAILURES = int(os.environ.get('LICHESS_BREAKER_FAILURES', 5))
+LICHESS_BREAKER_RESET_SECONDS = float(os.environ.get('LICHESS_BREAKER_RESET_SECONDS', 30))
+
+# Upstream request scheduler: every Lichess call waits for a slot from its priority
+# class. rate is requests/second, queue_timeout is seconds before giving up with 503,
+# and headroom is how many of the max_concurrency slots a class must leave free for
+# the classes above it (with the defaults, 2 are always kept for premium users).
+# These limits are the budget for the whole deployment. Each process schedules its
+# own calls, so the budget is split evenly over LICHESS_PROCESSES: set it to the
+# number of web server workers plus one for the precompute_dashboards worker.
+LICHESS_SCHEDULER = {
+    'processes': int(os.environ.get('LICHESS_PROCESSES', 1)),
+    'max_concurrency': int(os.environ.get('LICHESS_MAX_CONCURRENCY', 8)),
+    'classes': {
+        'interactive_premium': {'concurrency': 8, 'rate': 10, 'burst': 10, 'queue_timeout': 10, 'headroom': 0},
+        'interactive_free': {'concurrency': 6, 'rate': 5, 'burst': 5, 'queue_timeout': 10, 'headroom': 2},
+        'bulk': {'concurrency': 2, 'rate': 1, 'burst': 2, 'queue_timeout': 30, 'headroom': 3},
+        'background': {'concurrency': 2, 'rate': 1, 'burst': 2, 'queue_timeout': 300, 'headroom': 4},
+    },
+}
+
+# How long last known good Lichess data is kept for serving during outages
+STALE_DATA_TTL = int(os.environ.get('STALE_DATA_TTL', 24 * 60 * 60))
+# Minimum seconds between database writes of the same last known good value
+STALE_DATA_REFRESH = int(os.environ.get('STALE_DATA_REFRESH', 60 * 60))
+
+# Upper bound for ?max= on the streamed game listing
+MAX_EXPORT_GAMES = int(os.environ.get('MAX_EXPORT_GAMES', 10000))
+
+# Bootstrap prediction bands (?bands=1 on predict-future-ratings)
+RATING_BOOTSTRAP_RESAMPLES = int(os.environ.get('RATING_BOOTSTRAP_RESAMPLES', 400))
+RATING_BOOTSTRAP_TIME_BUDGET = float(os.environ.get('RATING_BOOTSTRAP_TIME_BUDGET', 1.5))  # seconds
+RATING_BOOTSTRAP_WORKERS = int(os.environ.get('RATING_BOOTSTRAP_WORKERS', 2))  # 0 runs in-process
+RATING_BOOTSTRAP_CHUNK = int(os.environ.get('RATING_BOOTSTRAP_CHUNK', 100))
+RATING_BOOTSTRAP_LEVEL = float(os.environ.get('RATING_BOOTSTRAP_LEVEL', 0.9))
+RATING_BOOTSTRAP_CACHE_TTL = int(os.environ.get('RATING_BOOTSTRAP_CACHE_TTL', 24 * 60 * 60))
+
+# Dashboard precomputation for linked Lichess accounts (manage.py precompute_dashboards)
+PRECOMPUTE_INTERVAL = int(os.environ.get('PRECOMPUTE_INTERVAL', 6 * 60 * 60))
+PRECOMPUTE_REQUESTS_PER_MINUTE = float(os.environ.get('PRECOMPUTE_REQUESTS_PER_MINUTE', 20))
+SNAPSHOT_MAX_AGE = int(os.environ.get('SNAPSHOT_MAX_AGE', 2 * PRECOMPUTE_INTERVAL))
+# Accounts that fail to refresh (e.g. closed on Lichess) are retried after
+# PRECOMPUTE_RETRY_BACKOFF seconds, doubling per consecutive failure up to the maximum
+PRECOMPUTE_RETRY_BACKOFF = int(os.environ.get('PRECOMPUTE_RETRY_BACKOFF', 15 * 60))
+PRECOMPUTE_MAX_RETRY_BACKOFF = int(os.environ.get('PRECOMPUTE_MAX_RETRY_BACKOFF', 7 * 24 * 60 * 60))
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'